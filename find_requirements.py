@@ -1,26 +1,51 @@
+import ast
 import os
 import re
 import subprocess
 
-def find_imports_in_file(file_path):
+from concurrent.futures import ThreadPoolExecutor
+
+IMPORT_RE = re.compile(r'^[ \t]*(?:import|from)[ \t]+([\w.]+)')
+
+def find_imports_in_file_by_line(file_path):
+    # Fallback for files that can't be parsed, e.g. written for another Python
+    # version
     imports = set()
-    with open(file_path, 'r') as file:
+    with open(file_path, 'r', buffering=1 << 16) as file:
         for line in file:
-            match = re.match(r'^\s*(import|from)\s+([\w.]+)', line)
-            if match:
-                module = match.group(2).split('.')[0]
-                imports.add(module)
+            match = IMPORT_RE.match(line)
+            if match and not match.group(1).startswith('.'):
+                imports.add(match.group(1).split('.', 1)[0])
     return imports
 
-def find_imports_in_project(directory):
+def find_imports_in_file(file_path):
     imports = set()
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.py'):
-                file_path = os.path.join(root, file)
-                imports.update(find_imports_in_file(file_path))
+    with open(file_path, 'r') as file:
+        source = file.read()
+    try:
+        tree = ast.parse(source, filename=file_path)
+    except SyntaxError:
+        return find_imports_in_file_by_line(file_path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            imports.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            # Skip relative imports, which are local to the project
+            if node.module and node.level == 0:
+                imports.add(node.module.split('.')[0])
     return imports
 
+def find_imports_in_project(directory):
+    file_paths = [
+        os.path.join(root, file)
+        for root, _, files in os.walk(directory)
+        for file in files
+        if file.endswith('.py')]
+    # Reading files is I/O-bound, so scan them concurrently
+    max_workers = min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return set().union(*executor.map(find_imports_in_file, file_paths))
+
 def write_requirements_file(imports, output_file='requirements.txt'):
     with open(output_file, 'w') as file:
         for i in imports:
@@ -30,5 +55,5 @@ if __name__ == '__main__':
     project_directory = '.'  # Change this to your project directory
     imports = find_imports_in_project(project_directory)
     write_requirements_file(imports)
-    print(f"requirements.txt has been generated with {len(versions)} packages.")
+    print(f"requirements.txt has been generated with {len(imports)} packages.")
 
@@ -0,0 +1,8 @@
+import pytest
+
+from trader.world import World
+
+
+@pytest.fixture(scope='session')
+def world():
+    return World(134, 'http://localhost:1/', False)
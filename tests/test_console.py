@@ -0,0 +1,56 @@
+import io
+
+from trader.console import Console
+
+
+def _render(table):
+    console = Console(
+        file=io.StringIO(), width=120, color_system='truecolor',
+        force_terminal=True)
+    console.print(table)
+    return console.file.getvalue()
+
+
+def _assert_tables_match(world, console):
+    # `console` may return cached tables, a new Console builds them afresh
+    player, day_index = world.player, world.day_index
+    fresh = Console()
+    location_table, *location_dicts = console.location_table(player, day_index)
+    fresh_location_table, *fresh_location_dicts = fresh.location_table(
+        player, day_index)
+    assert _render(location_table) == _render(fresh_location_table)
+    assert location_dicts == fresh_location_dicts
+
+    farmer_table, farmer_dict = console.farmer_table(player, day_index)
+    fresh_farmer_table, fresh_farmer_dict = fresh.farmer_table(player, day_index)
+    assert _render(farmer_table) == _render(fresh_farmer_table)
+    assert farmer_dict == fresh_farmer_dict
+
+    assert _render(console.inventory_table(player)) == \
+        _render(fresh.inventory_table(player))
+
+
+def test_cached_tables_match_rebuilt_tables(world):
+    console = Console()
+    player = world.player
+    start = player.location
+    _assert_tables_match(world, console)
+
+    farmer = start.farmers[0]
+    player.move_farmer(farmer, world.day_index)
+    _assert_tables_match(world, console)
+
+    good = next(good for good in world.goods if farmer.inventory[good.idx] > 0)
+    assert player.buy(good, 1, farmer)[0]
+    _assert_tables_match(world, console)
+    assert player.sell(good, 1, farmer)[0]
+    _assert_tables_match(world, console)
+
+    player.move_location(start.nearest_locations[0], world.day_index)
+    _assert_tables_match(world, console)
+    world.update()
+    _assert_tables_match(world, console)
+    player.move_location(start, world.day_index)
+    _assert_tables_match(world, console)
+    player.money_cents = 0
+    _assert_tables_match(world, console)
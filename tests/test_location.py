@@ -0,0 +1,31 @@
+import heapq
+
+import numpy as np
+import pytest
+
+from trader.location import Location
+
+
+def _locations(coords):
+    locations = [
+        Location(f'Location {i}', tuple(coord), 1.0, None, [])
+        for i, coord in enumerate(coords)]
+    for i, location in enumerate(locations):
+        location.idx = i
+    distances = np.linalg.norm(coords[:, None] - coords[None], axis=-1)
+    for location in locations:
+        location.set_locations_info(locations, distances[location.idx])
+    return locations
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_nearest_matches_nsmallest(seed):
+    # Integer coordinates make for many tied distances
+    rng = np.random.default_rng(seed)
+    locations = _locations(rng.integers(0, 4, (15, 2)).astype(float))
+    for location in locations:
+        others = [other for other in locations if other is not location]
+        for k in range(len(locations) + 1):
+            expected = heapq.nsmallest(
+                k, others, key=lambda other: location.location_distances[other.idx])
+            assert location.nearest(k) == expected
@@ -0,0 +1,39 @@
+import numpy as np
+
+from trader.noise_controller import NoiseController
+
+
+def _multilinear(t, y, x):
+    # Trilinear interpolation reproduces multilinear functions exactly
+    return 1 + 2 * t - 3 * y + 0.5 * x + 0.25 * t * y * x
+
+
+def test_sample_3d_batch_interpolates_trilinearly():
+    T, Y, X = 5, 4, 6
+    arr = _multilinear(*np.meshgrid(
+        np.arange(T), np.arange(Y), np.arange(X), indexing='ij'))
+    rng = np.random.default_rng(0)
+    tps, yps, xps = rng.random((3, 20))
+    tps[0], yps[0], xps[0] = 1, 1, 1
+
+    samples = NoiseController.sample_3d_batch(arr, tps, yps, xps)
+    expected = _multilinear(tps * (T - 1), yps * (Y - 1), xps * (X - 1))
+    assert np.allclose(samples, expected)
+
+
+def test_sample_3d_batch_broadcasts_over_stack_and_points():
+    rng = np.random.default_rng(1)
+    stack = rng.random((3, 4, 5, 6))
+    tps = rng.random((2, 1))
+    yps, xps = rng.random((2, 7))
+
+    samples = NoiseController.sample_3d_batch(stack, tps, yps, xps)
+    assert samples.shape == (3, 2, 7)
+    for i in range(3):
+        assert np.allclose(
+            samples[i], NoiseController.sample_3d_batch(stack[i], tps, yps, xps))
+
+    # Sampling at grid points returns the grid values
+    grid = NoiseController.sample_3d_batch(
+        stack, np.array([1 / 3]), np.array([0.5]), np.array([0.2]))
+    assert np.allclose(grid[:, 0], stack[:, 1, 2, 1])
@@ -0,0 +1,28 @@
+import numpy as np
+
+from trader.player import PriceStats
+
+
+def test_price_stats_match_batch_statistics():
+    rng = np.random.default_rng(0)
+    stats = PriceStats(3)
+    seen = [[], [], []]
+    for _ in range(50):
+        good_ids = np.flatnonzero(rng.random(3) < 0.7)
+        prices = rng.uniform(0.1, 5, len(good_ids))
+        stats.update(good_ids, prices)
+        for idx, price in zip(good_ids, prices):
+            seen[idx].append(price)
+
+    for idx in range(3):
+        assert stats.n[idx] == len(seen[idx])
+        assert np.isclose(stats.mean[idx], np.mean(seen[idx]))
+        assert np.isclose(stats.std(idx), np.std(seen[idx]))
+
+
+def test_price_stats_without_prices():
+    stats = PriceStats(2)
+    stats.update(np.array([1]), np.array([2.5]))
+    assert stats.std(0) == 0.
+    assert stats.mean[1] == 2.5
+    assert stats.std(1) == 0.
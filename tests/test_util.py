@@ -0,0 +1,56 @@
+import pytest
+
+from trader.util import clean_string, format_cents, parse_transaction
+
+
+@pytest.mark.parametrize('string, cleaned', [
+    ('Hello, World!', 'helloworld'),
+    ('  Stevens Point 2 ', 'stevenspoint2'),
+    ('Café', 'caf'),
+    ('', ''),
+])
+def test_clean_string(string, cleaned):
+    assert clean_string(string) == cleaned
+
+
+@pytest.mark.parametrize('cents, formatted', [
+    (0, '$0.00'),
+    (5, '$0.05'),
+    (105, '$1.05'),
+    (123456, '$1234.56'),
+    (-105, '-$1.05'),
+])
+def test_format_cents(cents, formatted):
+    assert format_cents(cents) == formatted
+
+
+@pytest.mark.parametrize('string, transaction', [
+    ('3 apples', (3, 'apples')),
+    ('apples 3', (3, 'apples')),
+    (' +2  Wheat ', (2, 'wheat')),
+    ('10 sweet corn', (10, 'sweet corn')),
+])
+def test_parse_transaction(string, transaction):
+    assert parse_transaction(string) == transaction
+
+
+@pytest.mark.parametrize('string', [
+    'corn 2 milk',
+    '2 c0rn',
+    '2 café',
+    '2 sweet-corn',
+])
+def test_parse_transaction_invalid_name(string):
+    assert parse_transaction(string) == (None, None)
+
+
+@pytest.mark.parametrize('string', [
+    '3',
+    'corn',
+    '0 corn',
+    '-1 corn',
+    '1.5 corn',
+    '+-2 corn',
+])
+def test_parse_transaction_invalid_quantity(string):
+    assert parse_transaction(string) == (None, None)
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+
+class FixedRng:
+    """Stands in for a Generator, drawing every uniform sample as `u` and
+    every exponential sample as `c` times its scale.
+
+    """
+    def __init__(self, u, c):
+        self.u = u
+        self.c = c
+
+    def exponential(self, scale):
+        return np.asarray(scale) * self.c
+
+    def random(self, shape):
+        return np.full(shape, self.u)
+
+
+def _scalar_good_delta(prod_rate, amount, max_amount, u, c):
+    # Scalar `NoiseController.sample_good_delta`, drawing from a FixedRng
+    increment = 0
+    p_increment = min(1.0, max(0.0, (max_amount - amount) / (amount + 0.0001)))
+    if u < p_increment:
+        if prod_rate == 0:
+            increment = 0
+        elif prod_rate <= 1:
+            increment = round(prod_rate * c)
+        else:
+            increment = max(0, round((prod_rate + 1) * c - 1))
+
+    decrement = 0
+    p_decrement = min(1.0, max(0.0, 0.25 + 0.5 * (amount / max_amount) / (1 + abs(1 - amount / max_amount))))
+    if u < p_decrement:
+        decrement = (0.05 + 0.2 * u * u) * amount
+    return increment - decrement
+
+
+@pytest.mark.parametrize('u, c', [(0.1, 0.7), (0.5, 2.3), (0.9, 1.2)])
+def test_update_inventories_matches_scalar_update(world, monkeypatch, u, c):
+    monkeypatch.setattr(world.noise_controller, 'rng', FixedRng(u, c))
+    today = 50
+    inventories = world.inventory_matrix.copy()
+    world.update_inventories(today)
+
+    # Scalar `Farmer.update_inventory`, one Farmer and Good at a time
+    for farmer, inventory in zip(world.farmers, inventories):
+        for good in world.goods:
+            location_prod_rate = world.location_prod_rates[
+                today, farmer.location.idx, good.idx]
+            farmer_prod_rate = location_prod_rate * farmer.good_dist[good.idx]
+            delta = _scalar_good_delta(
+                farmer_prod_rate, inventory[good.idx], good.max_amount, u, c)
+            expected = min(good.max_amount, max(0, int(inventory[good.idx] + delta)))
+            assert farmer.inventory[good.idx] == expected
+
+
+def test_update_farmer_prices_matches_scalar_prices(world):
+    world.update()
+
+    # Scalar `Farmer.compute_prices`, one Farmer and Good at a time
+    sensitivity = world.farmer_params['supply_sensitivity']
+    for farmer in world.farmers:
+        location = farmer.location
+        for good in world.goods:
+            if farmer.good_dist[good.idx] == 0:
+                expected = location.prices[good.idx]
+            else:
+                expected = location.prices[good.idx] * np.clip((
+                    location.supply_scores[good.idx] / max(0.1, farmer.inventory[good.idx]))**sensitivity, 0.5, 2)
+            assert np.isclose(farmer.prices[good.idx], expected)
+
+
+def test_supply_scores_match_scalar_scores(world):
+    world.update()
+
+    # Scalar `Location.compute_supply_scores`, one Location and Good at a time
+    farmers = [
+        farmer for location in world.locations for farmer in location.farmers]
+    for location in world.locations:
+        distance_weights = np.array([
+            np.exp(-location.location_distances[farmer.location.idx]**2)
+            for farmer in farmers])
+        distance_weights /= distance_weights.sum()
+        for good in world.goods:
+            inventory = np.array([farmer.inventory[good.idx] for farmer in farmers])
+            assert np.isclose(
+                location.supply_scores[good.idx], np.sum(distance_weights * inventory))
@@ -1,12 +1,12 @@
 """CLI console based on the `rich` library.
 
 """
-import math
+from collections import OrderedDict
+from itertools import zip_longest
+from typing import Any, Dict, Optional, Tuple
 
 import numpy as np
 
-from typing import Dict, List, Tuple
-
 from rich.console import Console as RichConsole
 from rich.table import Table
 from rich.text import Text
@@ -14,19 +14,38 @@ from rich.text import Text
 from .enums import Action, WorldState
 from .farmer import Farmer
 from .location import Location
-from .player import Player
-from .util import clean_string, rgb_interpolate
+from .player import Player, PriceStats
+from .util import rgb_interpolate
 
 # Normalizing constant for coloring Farmer and Location names based on the time
 # since their last visit
 C_VISIT = 10
-# Number of available nearest locations to move to
-N_LOCATIONS = 10
+# Visit styles for each whole number of days since the last visit, up to
+# `C_VISIT`
+VISIT_STYLES = [
+    rgb_interpolate((64, 255, 64), (255, 255, 255), t / C_VISIT)
+    for t in range(C_VISIT + 1)]
+# Number of color levels used for price styles on each side of the mean price
+N_PRICE_STYLES = 16
+# Price styles going from white to red (bad deals) and white to green (good
+# deals), indexed by quantized z-score magnitude
+BAD_PRICE_STYLES = [
+    rgb_interpolate((255, 255, 255), (255, 64, 64), i / (N_PRICE_STYLES - 1))
+    for i in range(N_PRICE_STYLES)]
+GOOD_PRICE_STYLES = [
+    rgb_interpolate((255, 255, 255), (64, 255, 64), i / (N_PRICE_STYLES - 1))
+    for i in range(N_PRICE_STYLES)]
+# Number of recently built tables kept per table type, for redraws
+TABLE_CACHE_SIZE = 8
 
 
 class Console(RichConsole):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Recently built tables, keyed on everything that affects their content
+        self._farmer_table_cache = OrderedDict()
+        self._inventory_table_cache = OrderedDict()
+        self._location_table_cache = OrderedDict()
         return
 
     def action_table(self, state: WorldState) -> Tuple[Table, Dict[str, Action]]:
@@ -65,7 +84,7 @@ class Console(RichConsole):
             raise NotImplementedError(f'No action table for {state.name}')
 
         for i, action in enumerate(actions):
-            table.add_row(f'{i + 1}.', action.value)
+            table.add_row(f'{i + 1}.', action.label)
             action_dict[action.name.lower()] = action
             action_dict[str(i + 1)] = action
 
@@ -91,24 +110,26 @@ class Console(RichConsole):
         table.add_column('Price', justify='left')
 
         farmer = player.trading_farmer
-        inventory = farmer.inventory
-        available_goods = [good for good in inventory if inventory[good] > 0]
-        available_goods = sorted(available_goods, key=lambda g: g.base_price)
-        available_quantities = [inventory[g] for g in available_goods]
-        prices = [farmer.buy_price(g) for g in available_goods]
+        available = sorted(
+            ((good, quant) for good, quant in zip(farmer.goods, farmer.inventory)
+             if quant > 0),
+            key=lambda gq: gq[0].base_price)
 
-        for good, quant, price in zip(available_goods, available_quantities, prices):
+        for good, quant in available:
+            price = farmer.buy_price(good)
             style = self.style_budget(price, player.money)
             if style == '':
-                style = self.style_price(price, player.seen_buy_prices[good], True)
+                style = self.style_price(
+                    price, player.seen_buy_prices, good.idx, True)
 
             table.add_row(
                 f'{quant}', good.name, f'${price:.2f}', style=style)
-        if len(available_goods) == 0:
+        if len(available) == 0:
             table.add_row('  ', 'Nothing to buy!', '  ')
 
         # Append pricing information to Player's price tracking
-        player.update_price_tracking(farmer, available_goods)
+        good_ids = np.array([good.idx for good, _ in available], dtype=int)
+        player.update_price_tracking(farmer, good_ids)
 
         return table
 
@@ -127,17 +148,26 @@ class Console(RichConsole):
                 numbers to the Farmer they represent.
 
         """
+        farmers = player.location.farmers
+        key = (
+            player.location,
+            day_index,
+            tuple(farmer.last_visit for farmer in farmers))
+        cached = self._cache_lookup(self._farmer_table_cache, key)
+        if cached is not None:
+            return cached
+
         table = Table(show_header=False)
         farmer_dict = {}
-        farmers = player.location.farmers
 
         for i, farmer in enumerate(farmers):
             time_since_last_visit = day_index - farmer.last_visit
             style = self.style_visit(time_since_last_visit)
             table.add_row(f'{i + 1}.', farmer.name, style=style)
-            farmer_dict[clean_string(farmer.name)] = farmer
+            farmer_dict[farmer.clean_name] = farmer
             farmer_dict[str(i + 1)] = farmer
 
+        self._cache_store(self._farmer_table_cache, key, (table, farmer_dict))
         return table, farmer_dict
 
     def inventory_table(self, player: Player) -> Table:
@@ -150,19 +180,24 @@ class Console(RichConsole):
             table (Table): Table of the Player's current inventory.
 
         """
+        inventory = player.inventory.tolist()
+        key = tuple(inventory)
+        cached = self._cache_lookup(self._inventory_table_cache, key)
+        if cached is not None:
+            return cached
+
         table = Table(show_header=False)
         table.add_column('Quantity', justify='left')
         table.add_column('Name')
 
-        inventory = player.inventory
-        goods = sorted(
-            [good for good in inventory], key=lambda g: g.base_price)
-        quantities = [inventory[good] for good in goods]
+        goods = sorted(player.goods, key=lambda g: g.base_price)
+        quantities = [inventory[good.idx] for good in goods]
         for quantity, good in zip(quantities, goods):
             table.add_row(str(quantity), good.name)
         if len(quantities) == 0:
             table.add_row('  ', 'No inventory')
 
+        self._cache_store(self._inventory_table_cache, key, table)
         return table
 
     def location_table(self, player: Player, day_index: int) -> \
@@ -184,14 +219,20 @@ class Console(RichConsole):
 
         """
         origin = player.location
-        other_locations = [loc for loc in origin.locations if loc != origin]
-        topk_locations = sorted(
-            other_locations,
-            key=lambda loc: origin.location_distances[loc])[:N_LOCATIONS]
-        topk_costs = [player.location_travel_cost(loc) for loc in topk_locations]
+        topk_locations = origin.nearest_locations
+        key = (
+            origin,
+            player.money,
+            day_index,
+            tuple(loc.last_visit for loc in topk_locations))
+        cached = self._cache_lookup(self._location_table_cache, key)
+        if cached is not None:
+            return cached
+
+        topk_costs = player.location_travel_costs(topk_locations)
 
         # Split locations and costs into two for two columns of each
-        col1_idx = math.ceil(len(topk_locations) / 2)
+        col1_idx = (len(topk_locations) + 1) // 2
         col1_locations = topk_locations[:col1_idx]
         col1_costs = topk_costs[:col1_idx]
         col2_locations = topk_locations[col1_idx:]
@@ -207,50 +248,51 @@ class Console(RichConsole):
 
         can_travel_dict = {}
         cannot_travel_dict = {}
+        budget = player.money
+
+        col1 = zip(col1_locations, col1_costs)
+        col2 = zip(col2_locations, col2_costs)
+        for i, ((loc1, c1), col2_entry) in enumerate(zip_longest(col1, col2)):
+            n1 = str(i + 1)
+            travel_dict1 = cannot_travel_dict if c1 > budget else can_travel_dict
+            travel_dict1[n1] = loc1
+            travel_dict1[loc1.clean_name] = loc1
 
-        for i in range(col1_idx):
-            # Populate first 2 cols, leave second two empty
-            loc1 = col1_locations[i]
-            c1 = col1_costs[i]
-            if c1 > player.money:
-                cannot_travel_dict[str(i+1)] = loc1
-                cannot_travel_dict[clean_string(loc1.name)] = loc1
-            else:
-                can_travel_dict[str(i+1)] = loc1
-                can_travel_dict[clean_string(loc1.name)] = loc1
-
-            style1 = self.style_budget(c1, player.money)
+            style1 = self.style_budget(c1, budget)
             if style1 == '':
                 style1 = self.style_visit(day_index - loc1.last_visit)
 
-            row = [
-                Text(f'{i+1}.', style=style1),
-                Text(loc1.name_with_info(), style=style1),
-                Text(f'${c1:.2f}', style=style1),
-                '', '', '']
-
-            if i < len(col2_locations):
-                # If there's info for the second 2 cols, populate them
-                loc2 = col2_locations[i]
-                c2 = col2_costs[i]
-                if c2 > player.money:
-                    cannot_travel_dict[str(col1_idx+i+1)] = loc2
-                    cannot_travel_dict[clean_string(loc2.name)] = loc2
-                else:
-                    can_travel_dict[str(col1_idx+i+1)] = loc2
-                    can_travel_dict[clean_string(loc2.name)] = loc2
-
-                style2 = self.style_budget(c2, player.money)
-                if style2 == '':
-                    style2 = self.style_visit(day_index - loc2.last_visit)
-
-                row[3] = Text(f'{col1_idx + i + 1}.', style=style2)
-                row[4] = Text(loc2.name_with_info(), style=style2)
-                row[5] = Text(f'${c2:.2f}', style=style2)
-
-            table.add_row(*row)
+            if col2_entry is None:
+                # Populate first 3 cols, leave second 3 empty
+                table.add_row(
+                    f'{n1}.', Text(loc1.name_with_info()), f'${c1:.2f}', '', '',
+                    '', style=style1)
+                continue
+
+            loc2, c2 = col2_entry
+            n2 = str(col1_idx + i + 1)
+            travel_dict2 = cannot_travel_dict if c2 > budget else can_travel_dict
+            travel_dict2[n2] = loc2
+            travel_dict2[loc2.clean_name] = loc2
+
+            style2 = self.style_budget(c2, budget)
+            if style2 == '':
+                style2 = self.style_visit(day_index - loc2.last_visit)
+
+            # The row style applies to the first location's cells, and the
+            # second location's cells override it with their own style.
+            # Location names are wrapped in Text so they are never parsed as
+            # markup
+            table.add_row(
+                f'{n1}.', Text(loc1.name_with_info()), f'${c1:.2f}',
+                Text(f'{n2}.', style=style2),
+                Text(loc2.name_with_info(), style=style2),
+                Text(f'${c2:.2f}', style=style2),
+                style=style1)
 
-        return table, can_travel_dict, cannot_travel_dict
+        result = (table, can_travel_dict, cannot_travel_dict)
+        self._cache_store(self._location_table_cache, key, result)
+        return result
 
     def sell_table(self, player: Player) -> Table:
         if player.trading_farmer is None:
@@ -262,23 +304,26 @@ class Console(RichConsole):
         table.add_column('Price', justify='left')
 
         farmer = player.trading_farmer
-        inventory = player.inventory
-        available_goods = [good for good in inventory if inventory[good] > 0]
-        available_goods = sorted(available_goods, key=lambda g: g.base_price)
-        available_quantities = [inventory[g] for g in available_goods]
-        prices = [farmer.sell_price(g) for g in available_goods]
-
-        for good, quant, price in zip(available_goods, available_quantities, prices):
+        available = sorted(
+            ((good, quant)
+             for good, quant in zip(player.goods, player.inventory.tolist())
+             if quant > 0),
+            key=lambda gq: gq[0].base_price)
+
+        for good, quant in available:
+            price = farmer.sell_price(good)
             style = self.style_budget(price, farmer.money)
             if style == '':
-                style = self.style_price(price, player.seen_sell_prices[good], False)
+                style = self.style_price(
+                    price, player.seen_sell_prices, good.idx, False)
             table.add_row(
                 f'{quant}', good.name, f'${price:.2f}', style=style)
 
-        if len(available_goods) == 0:
+        if len(available) == 0:
             table.add_row('  ', 'Nothing to sell!', '  ')
 
-        player.update_price_tracking(farmer, available_goods)
+        good_ids = np.array([good.idx for good, _ in available], dtype=int)
+        player.update_price_tracking(farmer, good_ids)
 
         return table
 
@@ -298,14 +343,19 @@ class Console(RichConsole):
         return 'gray53' if cost > budget else ''
 
     @staticmethod
-    def style_price(price: float, seen_prices: List[float], buying: bool) -> str:
+    def style_price(
+            price: float,
+            seen_prices: PriceStats,
+            good_idx: int,
+            buying: bool) -> str:
         """Compute a text style color code based on the z-score of `price`
         within the distribution of all prices the Player has seen so far.
 
         Args:
             price (float): A price of a Good (buy or sell).
-            seen_prices (List[float]): A list of all relevant prices seen by the
-                Player so far.
+            seen_prices (PriceStats): Running statistics of all relevant prices
+                seen by the Player so far.
+            good_idx (int): Index of the Good the price is for.
             buying (bool): If True, low prices are good (aka green). Otherwise,
                 high prices are good.
 
@@ -315,24 +365,23 @@ class Console(RichConsole):
                 white to green as z-score increases from 0 to 3+
 
         """
-        if len(seen_prices) == 0:
+        std = seen_prices.std(good_idx)
+        mean = float(seen_prices.mean[good_idx])
+        if seen_prices.n[good_idx] == 0:
             z = 0
-        elif np.std(seen_prices) == 0:
-            z = np.sign(price - seen_prices[0])
+        elif std == 0:
+            delta = float(price) - mean
+            z = (delta > 0) - (delta < 0)
         else:
-            z = np.clip(
-                (price - np.mean(seen_prices)) / np.std(seen_prices), -3, 3)
+            z = min(3, max(-3, (price - mean) / std))
         if buying:
             z = -z
         if z <= 0:
-            z = max(z, -2)
-            fraction = -z / 2
-            return rgb_interpolate(
-                (255, 255, 255), (255, 64, 64), fraction)
+            bucket = int(min(-z, 2) * (N_PRICE_STYLES - 1) / 2 + 0.5)
+            return BAD_PRICE_STYLES[bucket]
         elif z <= 2:
-            fraction = z / 2
-            return rgb_interpolate(
-                (255, 255, 255), (64, 255, 64), fraction)
+            bucket = int(z * (N_PRICE_STYLES - 1) / 2 + 0.5)
+            return GOOD_PRICE_STYLES[bucket]
         else:
             return 'bold rgb(64,255,64)'
 
@@ -351,6 +400,41 @@ class Console(RichConsole):
                 `time_since_last_visit` >= `C_VISIT`.
 
         """
-        fraction = min(1, time_since_last_visit / C_VISIT)
-        return rgb_interpolate(
-            (64, 255, 64), (255, 255, 255), fraction)
+        return VISIT_STYLES[min(C_VISIT, time_since_last_visit)]
+
+    @staticmethod
+    def _cache_lookup(cache: OrderedDict, key: Tuple) -> Optional[Any]:
+        """Look up a recently built table in a table cache.
+
+        Args:
+            cache (OrderedDict): Table cache, ordered from least to most
+                recently used.
+            key (Tuple): Key of the table.
+
+        Returns:
+            cached (Optional[Any]): The cached value, or None on a cache miss.
+
+        """
+        cached = cache.get(key)
+        if cached is not None:
+            cache.move_to_end(key)
+        return cached
+
+    @staticmethod
+    def _cache_store(cache: OrderedDict, key: Tuple, value: Any) -> None:
+        """Store a newly built table in a table cache, evicting the least
+        recently used entry if the cache is full.
+
+        Args:
+            cache (OrderedDict): Table cache, ordered from least to most
+                recently used.
+            key (Tuple): Key of the table.
+            value (Any): The table, and any lookup dicts built with it.
+
+        Returns: None
+
+        """
+        cache[key] = value
+        if len(cache) > TABLE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return
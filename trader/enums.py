@@ -1,22 +1,27 @@
 """Enums that are used across multiple files.
 
 """
-from enum import Enum
+from enum import IntEnum
 
 
-class Action(Enum):
-    BACK = 'Back'
-    MOVE = 'Move'
-    TRADE = 'Trade'
-    BUY = 'Buy'
-    SELL = 'Sell'
-    INVENTORY = 'Inventory'
-    MAP = 'Map'
-    BUY_NEGOTIATION = 'Buy Negotiation'
-    SELL_NEGOTIATION = 'Sell Negotiation'
+class Action(IntEnum):
+    BACK = 1
+    MOVE = 2
+    TRADE = 3
+    BUY = 4
+    SELL = 5
+    INVENTORY = 6
+    MAP = 7
+    BUY_NEGOTIATION = 8
+    SELL_NEGOTIATION = 9
 
+    @property
+    def label(self) -> str:
+        """Display name of the Action, e.g. 'Buy Negotiation'."""
+        return self.name.replace('_', ' ').title()
 
-class WorldState(Enum):
+
+class WorldState(IntEnum):
     INIT = 1
     AT_LOCATION = 2
     AT_FARMER = 3
@@ -8,9 +8,18 @@ from typing import Any, Dict, List
 from .good import Good
 from .location import Location
 from .noise_controller import NoiseController
+from .util import clean_string
 
 
 class Farmer:
+    # Many Farmers exist and their attributes are read in the daily update loop
+    __slots__ = (
+        'name', 'clean_name', 'location', 'params', 'noise_controller',
+        'goods', 'good_dist', 'inventory', 'prices', 'buy_price_cents',
+        'sell_price_cents', 'dpv', 'money_cents', 'max_money', '_lower_money',
+        '_upper_money', 'last_visit', 'local_idx', '_buy_markup',
+        '_sell_markup')
+
     def __init__(
             self,
             name: str,
@@ -19,26 +28,41 @@ class Farmer:
             noise_controller: NoiseController,
             goods: List[Good]):
         self.name = name
+        # Names never change, so the lookup key for menu input is computed once
+        self.clean_name = clean_string(name)
         self.location = location
         self.params = farmer_params
         self.noise_controller = noise_controller
         self.goods = goods
 
+        # Position of this Farmer in its Location's per-Farmer arrays
+        self.local_idx = len(self.location.farmers)
         self.location.add_farmer(self)
 
+        # Per-Good state, indexed by `Good.idx`
         self.good_dist = self.noise_controller.generate_farmer_good_dist(goods)
-        self.inventory = {good: 0 for good in goods}
-        self.prices: Dict[Good, float] = {}
+        self.inventory = np.zeros(len(goods), dtype=np.int64)
+        self.prices = np.zeros(len(goods))
+        # Buy and sell prices only change when `update_trade_prices` is called
+        # once per day, so they are cached rather than recomputed per lookup.
+        # They are stored as exact integer cents
+        self.buy_price_cents = np.zeros(len(goods), dtype=np.int32)
+        self.sell_price_cents = np.zeros(len(goods), dtype=np.int32)
+        # Price multipliers of the buy/sell spread, which is fixed
+        self._buy_markup = 1 + self.params['spread']
+        self._sell_markup = 1 - self.params['spread']
 
         # Daily production value
         self.dpv = -1
-        self.money = -1
+        # Money is kept in exact integer cents, like the Player's
+        self.money_cents = -1
+        # Absolute money bounds, fixed once `dpv` is known
+        self._lower_money = -1
+        self._upper_money = -1
         self.max_money = -1
 
         # Day index of last visit
         self.last_visit = -9999
-        # Resets to False each time the Player goes to a Location
-        self.seen_goods = False
 
         self.init()
         return
@@ -49,58 +73,29 @@ class Farmer:
         return self.name == other.name and self.location == other.location
 
     def __str__(self):
-        inv_string = ', '.join([f'{k.name}: {v}' for k, v in self.inventory.items()])
+        inv_string = ', '.join([f'{g.name}: {v}' for g, v in zip(self.goods, self.inventory)])
         return f'{self.name}:  {inv_string}'
 
     def buy_price(self, good) -> float:
-        """Compute the buy price of a given Good based on the computed price
-        and spread.
+        """Look up today's buy price of a given Good.
 
         Args:
-            good (Good): Good to compute the buy price of.
+            good (Good): Good to get the buy price of.
 
         Returns:
             price (float): Buy price of the given Good.
 
         """
-        return round(self.prices[good] * (1 + self.params['spread']), 2)
-
-    def compute_prices(self) -> Dict[Good, float]:
-        """Compute prices for all Goods.
-
-        Returns:
-            prices (Dict[Good, float]): Per-Good Farmer prices.
-
-        """
-        base_prices = self.location.prices
-        base_abundances = self.location.supply_scores
-        prices = {}
-        for good in self.goods:
-            if self.good_dist[good] == 0:
-                prices[good] = base_prices[good]
-            else:
-                sensitivity = self.params['supply_sensitivity']
-                prices[good] = base_prices[good] * np.clip((
-                    base_abundances[good] / max(0.1, self.inventory[good]))**sensitivity, 0.5, 2)
-        return prices
+        return self.buy_price_cents[good.idx] / 100
 
     def init(self) -> None:
         """Initialize the farmer.
 
-        """
-        self.init_inventory()
-        self.money = self.init_money()
-        return
-
-    def init_inventory(self) -> None:
-        """Initialize inventory as an accumulation of the first ten days'
-        worth of production.
-
-        Returns: None
+        Inventory is initialized afterwards for all Farmers at once by the
+        World.
 
         """
-        for day in range(10):
-            self.update_inventory(day)
+        self.money_cents = round(self.init_money() * 100)
         return
 
     def init_money(self) -> float:
@@ -123,91 +118,91 @@ class Farmer:
         upper_mult = self.params['upper_money_multiplier']
         # Daily production value
         self.dpv = sum([
-            self.good_dist[good] * good.base_price for good in self.goods])
+            self.good_dist[good.idx] * good.base_price for good in self.goods])
         assert self.dpv > 0, f'Calculated invalid DPV {self.dpv}'
+        self._lower_money = lower_mult * self.dpv
+        self._upper_money = upper_mult * self.dpv
         mult = lower_mult + (upper_mult - lower_mult) * self.noise_controller.rng.random()
         return mult * self.dpv
 
-    def sell_price(self, good) -> float:
-        """Compute the sell price of a given Good based on the computed price
-        and spread.
+    @property
+    def money(self) -> float:
+        """The Farmer's current amount of money, in dollars."""
+        return self.money_cents / 100
 
-        To prevent simple arbitrage, this is computed based on the baseline
-        prices of all Farmers in the same location.
+    def sell_price(self, good) -> float:
+        """Look up today's sell price of a given Good.
 
         Args:
-            good (Good): Good to compute the sell price of.
+            good (Good): Good to get the sell price of.
 
         Returns:
             price (float): Sell price of the given Good.
 
         """
-        all_farmers = self.location.farmers
-        min_price = min([farmer.prices[good] for farmer in all_farmers])
-        return round(min_price * (1 - self.params['spread']), 2)
+        return self.sell_price_cents[good.idx] / 100
 
-    def update(self, today: int) -> None:
+    def update(self) -> None:
         """Update farmer variables.
 
-        Args:
-            today (int): Day of the year.
+        Inventory and prices are updated beforehand for all Farmers at once by
+        the World.
 
         Returns: None
 
         """
-        self.update_inventory(today)
-        self.prices = self.compute_prices()
-        self.money = self.update_money()
+        self.money_cents = self.update_money()
         return
 
-    def update_inventory(self, today: int) -> None:
-        """Update farmer inventory.
+    def update_trade_prices(self, min_prices: np.ndarray) -> None:
+        """Update the cached buy and sell prices of all Goods based on the
+        computed prices and spread.
+
+        To prevent simple arbitrage, sell prices are computed based on the
+        baseline prices of all Farmers in the same location.
 
         Args:
-            today (int): Day of the year.
+            min_prices (np.ndarray): Per-Good minimum price among all Farmers
+                at this Farmer's Location.
 
-        Returns: None.
+        Returns: None
 
         """
-        for good in self.goods:
-            location_prod_rate = self.location.prod_rate(good, today)
-            farmer_prod_rate = location_prod_rate * self.good_dist[good]
-            delta = self.noise_controller.sample_good_delta(
-                farmer_prod_rate, self.inventory[good], good.max_amount)
-            self.inventory[good] = min(good.max_amount, max(0,
-                int(self.inventory[good] + delta)))
+        self.buy_price_cents = np.rint(
+            self.prices * self._buy_markup * 100).astype(np.int32)
+        self.sell_price_cents = np.rint(
+            min_prices * self._sell_markup * 100).astype(np.int32)
         return
 
-    def update_money(self) -> float:
+    def update_money(self) -> int:
         """Update the Farmer's money.
 
+        Growth and decay are applied in dollars, and the result is rounded to
+        whole cents once.
+
         Returns:
-            money (float): The new money of the Farmer.
+            money_cents (int): The new money of the Farmer, in cents.
 
         """
-        new_money = self.money
-
-        lower_mult = self.params['lower_money_multiplier']
-        upper_mult = self.params['upper_money_multiplier']
+        money = self.money
 
-        if lower_mult <= self.money / self.dpv <= upper_mult:
-            return new_money
+        if self._lower_money <= money <= self._upper_money:
+            return self.money_cents
 
-        if self.money < lower_mult * self.dpv:
+        if money < self._lower_money:
             p_growth = self.params['p_money_growth']
             growth_factor = self.params['money_growth_factor']
             if self.noise_controller.rng.random() < p_growth:
                 # If money is very low, replace with a fraction of DPV. Else
                 # grow multiplicatively
-                if self.money < 0.25 * self.dpv:
-                    new_money = 0.25 * self.dpv
-                else:
-                    new_money = self.money * growth_factor
-            return new_money
+                if money < 0.25 * self.dpv:
+                    return round(0.25 * self.dpv * 100)
+                return round(money * growth_factor * 100)
+            return self.money_cents
 
-        # If we're here, self.money > upper_mult * dpv
+        # If we're here, money > self._upper_money
         p_decay = self.params['p_money_decay']
         decay_factor = self.params['money_decay_factor']
         if self.noise_controller.rng.random() < p_decay:
-            new_money *= decay_factor
-        return new_money
+            return round(money * decay_factor * 100)
+        return self.money_cents
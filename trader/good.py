@@ -28,6 +28,8 @@ class Good:
 
         # Calculated after initialization
         self.base_abundance = None
+        # Position of this Good in per-Good arrays, set by the World
+        self.idx = None
         return
 
     def __repr__(self):
@@ -39,3 +41,7 @@ class Good:
     def set_base_abundance(self, abundance: float):
         self.base_abundance = abundance
         return
+
+    def set_index(self, idx: int):
+        self.idx = idx
+        return
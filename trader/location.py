@@ -3,47 +3,77 @@
 """
 import numpy as np
 
-from typing import Dict, List
+from typing import List, Tuple
 
 from .good import Good
 from .noise_controller import NoiseController
+from .util import clean_string
+
+# Number of nearest Locations available to move to
+N_LOCATIONS = 10
 
 
 class Location:
+    __slots__ = (
+        'name', 'clean_name', 'supply_sensitivity', 'noise_controller',
+        'goods', 'location', 'idx', 'location_distances', 'locations',
+        '_distances', 'nearest_locations', 'farmers', 'farmer_prices',
+        'supply_weights', 'seen_goods', 'supply_scores', 'prices',
+        'base_prices', 'base_abundances', 'last_visit')
+
     def __init__(
             self,
             name: str,
+            location: Tuple[float, float],
             supply_sensitivity: float,
             noise_controller: NoiseController,
             goods: List[Good]):
         self.name = name
+        # Names never change, so the lookup key for menu input is computed once
+        self.clean_name = clean_string(name)
         self.supply_sensitivity = supply_sensitivity
         self.noise_controller = noise_controller
         self.goods = goods
 
-        self.location = self.noise_controller.sample_location()
+        # Sampled by the World for all Locations at once
+        self.location = location
+        # Position of this Location in the World's Location list and
+        # per-Location arrays, set by the World
+        self.idx = None
 
-        self.location_distances: Dict['Location', float] = None
+        # Distances to all Locations, indexed by `Location.idx`
+        self.location_distances: np.ndarray = None
         self.locations: List['Location'] = None
+        # `location_distances` with this Location's own entry set to inf, so
+        # it is never its own neighbor
+        self._distances: np.ndarray = None
+        # Nearest other Locations, sorted by distance. Locations are fixed
+        # after World construction, so this is computed once
+        self.nearest_locations: List['Location'] = []
         self.farmers: List['Farmer'] = []
-
-        self.supply_scores: Dict[Good, float] = {}
-        self.prices: Dict[Good, float] = {}
+        # Prices of this Location's Farmers, one row per Farmer. A view into
+        # the World's price matrix, set by the World
+        self.farmer_prices: np.ndarray = None
+        # Per-Farmer weights of the supply score, for all Farmers in the World
+        # in `locations` order. Locations and Farmers are fixed after World
+        # construction, so these are computed once
+        self.supply_weights: np.ndarray = None
+        # Whether the Player has seen each Farmer's goods since arriving here,
+        # in `farmers` order
+        self.seen_goods: np.ndarray = None
+
+        # Per-Good state, indexed by `Good.idx`. Supply scores are computed
+        # for all Locations at once by the World
+        self.supply_scores = np.zeros(len(goods))
+        self.prices = np.zeros(len(goods))
+        # Good baselines, set by the World once base abundances are known
+        self.base_prices: np.ndarray = None
+        self.base_abundances: np.ndarray = None
 
         # Day index of last visit
         self.last_visit = -9999
         return
 
-    def __eq__(self, other: 'Location'):
-        if isinstance(other, Location):
-            return self.name == other.name \
-                and self.location[0] == other.location[0] \
-                and self.location[1] == other.location[1]
-        return False
-
-    def __hash__(self):
-        return hash((self.name, self.location[0], self.location[1]))
-
     def __repr__(self):
         return self.name
 
@@ -55,63 +85,50 @@ class Location:
         self.farmers.append(farmer)
         return
 
-    def compute_prices(self) -> Dict[Good, float]:
+    def compute_prices(self) -> np.ndarray:
         """Compute prices for all goods.
 
         Returns:
-            prices (Dict[Good, float]): Per-good Location prices.
+            prices (np.ndarray): Per-good Location prices, indexed by
+                `Good.idx`.
 
         """
-        base_prices = {good: good.base_price for good in self.goods}
-        base_abundances = {good: good.base_abundance for good in self.goods}
-        prices = {
-            good: base_prices[good] * np.clip((
-                    base_abundances[good] / max(0.1, self.supply_scores[good]))**self.supply_sensitivity, 0.25, 4)
-            for good in self.goods}
-        return prices
+        return self.base_prices * np.clip((
+            self.base_abundances / np.maximum(0.1, self.supply_scores))**self.supply_sensitivity, 0.25, 4)
 
-    def compute_supply_scores(self) -> Dict[Good, float]:
-        """Compute a supply score for Goods, centered at this location.
+    def init_seen_goods(self):
+        """Initialize the per-Farmer flags of whether the Player has seen a
+        Farmer's goods.
 
-        Supply score is a weighted average of Good inventory levels, where
-        weights per-Farmer are proportional to the distance between the Farmer's
-        Location and this Location.
+        Must be called after all Farmers are set up.
 
-        Returns:
-            supply_scores (Dict[Good, float]): Supply scores for each Good.
+        Returns: None
 
         """
-        farmers = [
-            farmer
-            for location in self.locations
-            for farmer in location.farmers]
-        distance_weights = np.array([
-            np.exp(-self.location_distances[farmer.location]**2)
-            for farmer in farmers])
-        distance_weights /= distance_weights.sum()
+        self.seen_goods = np.zeros(len(self.farmers), dtype=bool)
+        return
 
-        supply_scores = {}
-        for good in self.goods:
-            inventory = np.array([farmer.inventory[good] for farmer in farmers])
-            supply_scores[good] = np.sum(distance_weights * inventory)
+    def init_supply_weights(self):
+        """Compute the per-Farmer weights of this Location's supply scores.
 
-        return supply_scores
+        A Location's supply score for a Good is a weighted average of Farmer
+        inventories of the Good, where weights per-Farmer are proportional to
+        the distance between the Farmer's Location and this Location.
 
-    def distance_to(self, other: 'Location') -> float:
-        """Calculate the distance between two locations.
+        Must be called after all Locations and Farmers are set up.
 
-        Args:
-            other (Location): Another location.
-
-        Returns:
-            (float): Distance between this Location and `other`.
+        Returns: None
 
         """
-        x0 = self.location[0]
-        y0 = self.location[1]
-        x1 = other.location[0]
-        y1 = other.location[1]
-        return np.sqrt((x0 - x1)**2 + (y0 - y1)**2)
+        farmers = [
+            farmer
+            for location in self.locations
+            for farmer in location.farmers]
+        distance_weights = np.array([
+            np.exp(-self.location_distances[farmer.location.idx]**2)
+            for farmer in farmers])
+        self.supply_weights = distance_weights / distance_weights.sum()
+        return
 
     def name_with_info(self) -> str:
         """Display name, along with number of farmers in parentheses if this
@@ -125,66 +142,122 @@ class Location:
             return self.name
         return f'{self.name} ({len(self.farmers)})'
 
-    def prod_rate(self, good: Good, day: int) -> float:
-        """Calculate today's production rate for a good.
+    def nearest(self, k: int) -> List['Location']:
+        """Find the `k` nearest other Locations.
+
+        Uses a partial sort, so only the `k` selected Locations are fully
+        sorted.
 
         Args:
-            good (Good): Good to calculate production rate for.
-            day (int): Day of the year.
+            k (int): Number of Locations to find.
 
         Returns:
-            (float): The production rate for the good.
+            nearest (List[Location]): Up to `k` nearest other Locations, sorted
+                by distance.
+
+        """
+        k = min(k, len(self.locations) - 1)
+        if k <= 0:
+            return []
+        # Select every Location within the k-th smallest distance, in
+        # `locations` order, so that ties keep that order
+        kth_distance = np.partition(self._distances, k - 1)[k - 1]
+        idx = np.flatnonzero(self._distances <= kth_distance)
+        order = idx[np.argsort(self._distances[idx], kind='stable')[:k]]
+        return [self.locations[j] for j in order]
+
+    def set_farmer_prices(self, farmer_prices: np.ndarray):
+        """Set a reference to the prices of this Location's Farmers.
+
+        Args:
+            farmer_prices (np.ndarray): (n_farmers, n_goods) price matrix view,
+                with rows in `farmers` order.
+
+        Returns: None
 
         """
-        return good.base_prod_rate + self.noise_controller.sample_good_prod(
-            good, day, self.location) * good.prod_rate_multiplier
+        self.farmer_prices = farmer_prices
+        return
+
+    def set_good_baselines(
+            self, base_prices: np.ndarray, base_abundances: np.ndarray):
+        """Set the base prices and abundances of all Goods.
+
+        Args:
+            base_prices (np.ndarray): Base price of each Good, indexed by
+                `Good.idx`.
+            base_abundances (np.ndarray): Base abundance of each Good, indexed
+                by `Good.idx`.
+
+        Returns: None
+
+        """
+        self.base_prices = base_prices
+        self.base_abundances = base_abundances
+        return
+
+    def set_index(self, idx: int):
+        """Set the position of this Location in per-Location arrays.
+
+        Args:
+            idx (int): Index of this Location.
+
+        Returns: None
+
+        """
+        self.idx = idx
+        return
 
     def set_locations_info(
             self, locations: List['Location'], location_distances: np.ndarray):
         """Set information about other Locations.
 
         This information consists of a list of other Locations and the distances
-        to them from this Location.
+        to them from this Location. The `N_LOCATIONS` nearest other Locations
+        are cached in `nearest_locations`.
 
         Args:
             locations (List[Location]): List of all Locations.
             location_distances (np.ndarray): Distances from all Locations to
-                this location.
+                this location, indexed by `Location.idx`.
 
         Returns: None
 
         """
         self.locations = locations
-        self.location_distances = {
-            location: distance
-            for location, distance in zip(locations, location_distances)}
+        self.location_distances = location_distances
+        self._distances = np.array(location_distances, dtype=float)
+        self._distances[self.idx] = np.inf
+        self.nearest_locations = self.nearest(N_LOCATIONS)
         return
 
-    def set_locations(self, locations: List['Location']):
-        """Set a reference to all Locations.
+    def update(self):
+        """Update this Location's prices.
 
-        Args:
-            locations (List[Location]): List of all Locations.
+        Supply scores are updated beforehand for all Locations at once by the
+        World.
 
-        Returns: None
+        Returns: None.
 
         """
-        self.locations = locations
+        # Assign in place to keep the World's price view valid
+        self.prices[:] = self.compute_prices()
         return
 
-    def update(self, today: int):
-        """Update this Location's attributes.
+    def update_farmers(self):
+        """Update the Farmers at this Location.
 
-        Args:
-            today (int): Day of the year.
+        Must be called after the prices of every Farmer have been updated.
 
         Returns: None.
 
         """
-        self.supply_scores = self.compute_supply_scores()
-        self.prices = self.compute_prices()
-
         for farmer in self.farmers:
-            farmer.update(today)
-
+            farmer.update()
+        if not self.farmers:
+            return
+        # Sell prices depend on the prices of every Farmer at this Location
+        min_prices = self.farmer_prices.min(axis=0)
+        for farmer in self.farmers:
+            farmer.update_trade_prices(min_prices)
         return
@@ -6,12 +6,15 @@ import random
 
 import numpy as np
 
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Dict, List, Tuple
 
 from perlin_numpy import generate_perlin_noise_3d
 
 from .good import Good
 
+# Initial number of subset trials drawn at once by `generate_farmer_good_dist`
+GOOD_DIST_TRIALS = 16
 LOCATION_GRID_SIZE = 256
 MIN_FARMER_PROD_PROBABILITY = 0.15
 
@@ -50,8 +53,10 @@ class NoiseController:
                 min_n_goods (float): Minimum number of goods a farmer produces.
         """
         self.seed = seed
+        # The `names` package draws from the global `random` state. All NumPy
+        # randomness comes from explicit Generators, so the global NumPy state
+        # is left alone
         random.seed(seed)
-        np.random.seed(seed)
         self.rng = np.random.default_rng(seed)
 
         self.year_length = year_length
@@ -60,20 +65,35 @@ class NoiseController:
         self.farmer_params = farmer_params
 
         self.location_cdf = self.init_location_density()
-
-        self.good_prod_maps = {
-            good: self.generate_good_prod(good)
-            for good in goods}
+        # Location coordinates of each flattened location CDF bin, so that
+        # sampling is a lookup rather than an index unravel
+        self.location_grid_xs = np.tile(
+            np.arange(LOCATION_GRID_SIZE), LOCATION_GRID_SIZE) / LOCATION_GRID_SIZE
+        self.location_grid_ys = np.repeat(
+            np.arange(LOCATION_GRID_SIZE), LOCATION_GRID_SIZE) / LOCATION_GRID_SIZE
+
+        # Production rate maps of all goods, stacked into a single
+        # (n_goods, T, Y, X) array indexed by `Good.idx`, so that all goods can
+        # be sampled at once. Each good's map is generated from its own RNG, so
+        # the maps can be generated concurrently and still be reproducible
+        good_rngs = [
+            np.random.default_rng(good_seed)
+            for good_seed in np.random.SeedSequence(seed).spawn(len(goods))]
+        with ThreadPoolExecutor(
+                max_workers=min(len(goods), os.cpu_count() or 1)) as executor:
+            self.prod_stack = np.stack(list(executor.map(
+                self.generate_good_prod, goods, good_rngs)))
         return
 
-    def generate_farmer_good_dist(self, goods: List[Good]) -> Dict[Good, float]:
+    def generate_farmer_good_dist(self, goods: List[Good]) -> np.ndarray:
         """Produce a farmer production distribution over available goods.
 
         Args:
             goods (List[Good]): List of available goods.:
 
         Returns:
-            good_dist (Dict[Good, float]): Farmer production rates per good.
+            good_dist (np.ndarray): Farmer production rates per good, indexed
+                by `Good.idx`.
 
         """
         mean_n_goods = self.farmer_params['mean_n_goods']
@@ -82,21 +102,27 @@ class NoiseController:
         popularities = np.array([good.popularity for good in goods])
         pop_probs = popularities / np.sum(popularities)
         scaled_pop_probs = np.minimum(mean_n_goods * pop_probs, 1)
-        # Keep trying to generate a subset until the min is achieved
-        found_n_goods = -1
-        while found_n_goods < min_n_goods:
-            selections = self.rng.random(len(goods)) < scaled_pop_probs
-            found_n_goods = selections.sum()
+        # Keep trying to generate a subset until the min is achieved. Trials
+        # are drawn in batches, doubling the batch size after each failure
+        n_trials = GOOD_DIST_TRIALS
+        while True:
+            trials = self.rng.random((n_trials, len(goods))) < scaled_pop_probs
+            found = np.flatnonzero(trials.sum(axis=1) >= min_n_goods)
+            if found.size > 0:
+                selections = trials[found[0]]
+                break
+            n_trials *= 2
         prod_rates = np.maximum(
             self.rng.random(len(goods)), MIN_FARMER_PROD_PROBABILITY)
-        selected_prod_rates = selections * prod_rates
-        return {good: rate for good, rate in zip(goods, selected_prod_rates)}
+        return selections * prod_rates
 
-    def generate_good_prod(self, good: Good) -> np.ndarray:
+    def generate_good_prod(
+            self, good: Good, rng: np.random.Generator) -> np.ndarray:
         """Generate a 3D good production rate map.
 
         Args:
             good (Good): Good this production rate map is for.
+            rng (np.random.Generator): RNG to generate the map's noise with.
 
         Returns:
             prod_map (np.ndarray): 3D good production rate map.
@@ -107,11 +133,16 @@ class NoiseController:
         nt = self.prod_params['temporal_res']
         ot = self.prod_params['temporal_octaves']
         noise = generate_perlin_noise_3d(
-            (nt, nx, nx), (ot, ox, ox), tileable=(True, False, False))
-        # Rescale and exponentiate
-        noise = (noise - noise.min()) / (noise.max() - noise.min())
-        noise = noise ** good.prod_rate_exponent
-        return noise
+            (nt, nx, nx), (ot, ox, ox), tileable=(True, False, False), rng=rng)
+        # Rescale and exponentiate in place, without full-size temporaries
+        noise_min = noise.min()
+        noise_range = noise.max() - noise_min
+        noise -= noise_min
+        noise /= noise_range
+        np.power(noise, good.prod_rate_exponent, out=noise)
+        # Single precision is plenty for production rates, and halves the
+        # memory read by every sample
+        return noise.astype(np.float32, copy=False)
 
     def init_location_density(self) -> np.ndarray:
         """Initialize the location density distribution.
@@ -130,47 +161,36 @@ class NoiseController:
         std_min = self.location_params['std_min']
         std_max = self.location_params['std_max']
 
-        grid_y, grid_x = np.meshgrid(
-            np.linspace(0, 1, LOCATION_GRID_SIZE),
-            np.linspace(0, 1, LOCATION_GRID_SIZE))
-        density = np.zeros((LOCATION_GRID_SIZE, LOCATION_GRID_SIZE))
+        # Open grids broadcast against each other, so the full 2D coordinate
+        # grids are never materialized. `grid_y` varies along the second axis
+        # and `grid_x` along the first
+        grid_x, grid_y = np.ogrid[
+            0:1:LOCATION_GRID_SIZE * 1j, 0:1:LOCATION_GRID_SIZE * 1j]
 
         amps = amp_min + (amp_max - amp_min) * self.rng.random(n_clusters)
         means = self.rng.random((n_clusters, 2))
         stds = std_min + (std_max - std_min) * self.rng.random(n_clusters)
 
-        for amp, mean, std in zip(amps, means, stds):
-            gaussian = amp * np.exp(
-                -((grid_y - mean[0])**2 + (grid_x - mean[1])**2) / (2 * std**2))
-            density += gaussian
+        # Evaluate all cluster Gaussians at once, along a leading cluster axis
+        amps = amps[:, np.newaxis, np.newaxis]
+        mean_y = means[:, 0, np.newaxis, np.newaxis]
+        mean_x = means[:, 1, np.newaxis, np.newaxis]
+        stds = stds[:, np.newaxis, np.newaxis]
+        gaussians = amps * np.exp(
+            -((grid_y - mean_y)**2 + (grid_x - mean_x)**2) / (2 * stds**2))
+        density = gaussians.sum(axis=0)
         density /= np.sum(density)
 
         location_cdf = np.cumsum(density.flatten())
         return location_cdf
 
-    def sample_good_prod(
-            self, good: Good, day: int, location: Tuple[float, float]) -> float:
-        """Sample a good's production rate map at a time and location.
-
-        Args:
-            good (good): Good to sample a production map for.
-            day (int): Day to sample for.
-            location (Tuple[float, float]): Location to sample for.
-
-        Returns:
-            sample_value (float): Sample value.
-
-        """
-        return self.sample_3d(
-            self.good_prod_maps[good],
-            day / self.year_length,
-            location[0],
-            location[1])
-
-    def sample_good_delta(
-            self, prod_rate: float, amount: int, max_amount: int) -> int:
-        """Calculate a good's per-turn quantity change based on its
-        production rate.
+    def sample_good_delta_batch(
+            self,
+            prod_rates: np.ndarray,
+            amounts: np.ndarray,
+            max_amounts: np.ndarray) -> np.ndarray:
+        """Calculate per-turn quantity changes for many goods at once, based
+        on their production rates.
 
         Increments are stochastic, and probability of applying an increment
         drops to 0 as the current amount approaches some maximum.
@@ -179,81 +199,119 @@ class NoiseController:
         drops to 0 as the current amount approaches 0.
 
         Args:
-            prod_rate (float): Per-turn production rate.
-            amount (int): Current amount of the good.
-            max_amount (int):
+            prod_rates (np.ndarray): Per-turn production rates.
+            amounts (np.ndarray): Current amounts of the goods, same shape as
+                `prod_rates`.
+            max_amounts (np.ndarray): Maximum amounts of the goods, broadcastable
+                to the shape of `prod_rates`.
 
         Returns:
-            increment (int): Good quantity increment.
+            increments (np.ndarray): Good quantity increments, same shape as
+                `prod_rates`.
 
         """
-        increment = 0
-        # Calculate an increment with some probability
-        p_increment = min(1.0, max(0.0, (max_amount - amount) / (amount + 0.0001)))
-        if random.random() < p_increment:
-            if prod_rate == 0:
-                increment = 0
-            elif prod_rate <= 1:
-                increment = round(self.rng.exponential(prod_rate))
-            else:
-                increment = np.maximum(0, round(self.rng.exponential(prod_rate + 1) - 1))
-
-        decrement = 0
-        # Calculate a decrement with some probability
-        p_decrement = min(1.0, max(0.0, 0.25 + 0.5 * (amount / max_amount) / (1 + abs(1 - amount / max_amount))))
-        if random.random() < p_decrement:
-            decrement = (0.05 + 0.2 * random.random() * random.random()) * amount
-        return increment - decrement
-
-    def sample_location(self) -> Tuple[float, float]:
-        """Sample a 2D "location" in the range [0,1]x[0,1] based on the
+        shape = prod_rates.shape
+        low_rate = prod_rates <= 1
+
+        # Calculate increments with some probability
+        p_increment = np.clip((max_amounts - amounts) / (amounts + 0.0001), 0, 1)
+        samples = self.rng.exponential(np.where(low_rate, prod_rates, prod_rates + 1))
+        increments = np.where(
+            low_rate, np.round(samples), np.maximum(0, np.round(samples - 1)))
+        increments[self.rng.random(shape) >= p_increment] = 0
+
+        # Calculate decrements with some probability
+        fill = amounts / max_amounts
+        p_decrement = np.clip(0.25 + 0.5 * fill / (1 + np.abs(1 - fill)), 0, 1)
+        # Both uniform factors of the decrement fraction come from one draw
+        factors = self.rng.random((2,) + shape)
+        decrements = (0.05 + 0.2 * factors[0] * factors[1]) * amounts
+        decrements[self.rng.random(shape) >= p_decrement] = 0
+        return increments - decrements
+
+    def sample_goods_prod_batch(
+            self, days: np.ndarray, locations: np.ndarray) -> np.ndarray:
+        """Sample the production rate maps of all goods on many days at many
+        locations.
+
+        Args:
+            days (np.ndarray): Days to sample for, with shape (n_days,).
+            locations (np.ndarray): Locations to sample for, with shape
+                (n_locations, 2).
+
+        Returns:
+            sample_values (np.ndarray): Sample values, with shape
+                (n_goods, n_days, n_locations) and goods indexed by
+                `Good.idx`.
+
+        """
+        return self.sample_3d_batch(
+            self.prod_stack,
+            days[:, np.newaxis] / self.year_length,
+            locations[:, 0],
+            locations[:, 1])
+
+    def sample_locations(self, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample many 2D "locations" in the range [0,1]x[0,1] based on the
         constructed location CDF.
 
+        Args:
+            n (int): Number of locations to sample.
+
         Returns:
-            location_x: X location.
-            location_y: Y location.
+            location_xs (np.ndarray): X locations, with shape (n,).
+            location_ys (np.ndarray): Y locations, with shape (n,).
 
         """
-        r = self.rng.random()
+        r = self.rng.random(n)
         idx = np.searchsorted(self.location_cdf, r)
-        y_idx, x_idx = np.unravel_index(idx, (LOCATION_GRID_SIZE, LOCATION_GRID_SIZE))
-        location_x = x_idx / LOCATION_GRID_SIZE
-        location_y = y_idx / LOCATION_GRID_SIZE
-        return location_x, location_y
+        return self.location_grid_xs[idx], self.location_grid_ys[idx]
 
     @staticmethod
-    def sample_3d(arr: np.ndarray, tp: float, yp: float, xp: float) -> float:
-        """Sample a 3D array using trilinear interpolation.
+    def sample_3d_batch(
+            arr: np.ndarray,
+            tps: np.ndarray,
+            yps: np.ndarray,
+            xps: np.ndarray) -> np.ndarray:
+        """Sample a 3D array, or a stack of 3D arrays, at many points using
+        trilinear interpolation.
 
         Args:
-            arr (np.ndarray): A 3D array.
-            tp (float): First axis sample coordinate, scaled to range [0,1].
-            yp (float): Second axis sample coordinate, scaled to range [0, 1].
-            xp (float): Third axis sample coordinate, scaled to range [0, 1].
+            arr (np.ndarray): A 3D array, or a stack of 3D arrays along any
+                number of leading axes.
+            tps (np.ndarray): First axis sample coordinates, scaled to range
+                [0,1].
+            yps (np.ndarray): Second axis sample coordinates, scaled to range
+                [0, 1].
+            xps (np.ndarray): Third axis sample coordinates, scaled to range
+                [0, 1].
 
         Returns:
-            c (float): Trilinearly-interpolated sample value.
+            c (np.ndarray): Trilinearly-interpolated sample values, with the
+                leading axes of `arr` followed by the broadcast shape of `tps`,
+                `yps`, and `xps`.
 
         """
-        T, Y, X = arr.shape
+        T, Y, X = arr.shape[-3:]
 
-        # Scale tp, yp, xp to the array dimensions
-        tp = tp * (T - 1)
-        yp = yp * (Y - 1)
-        xp = xp * (X - 1)
+        # Scale tps, yps, xps to the array dimensions
+        tps = tps * (T - 1)
+        yps = yps * (Y - 1)
+        xps = xps * (X - 1)
 
-        # Find the indices of the corners
-        t0, y0, x0 = int(np.floor(tp)), int(np.floor(yp)), int(np.floor(xp))
-        t1, y1, x1 = min(t0 + 1, T - 1), min(y0 + 1, Y - 1), min(x0 + 1, X - 1)
+        # Find the indices of the corners. Coordinates are nonnegative, so
+        # truncation is the floor
+        t0, y0, x0 = tps.astype(np.intp), yps.astype(np.intp), xps.astype(np.intp)
+        t1, y1, x1 = np.minimum(t0 + 1, T - 1), np.minimum(y0 + 1, Y - 1), np.minimum(x0 + 1, X - 1)
 
         # Compute the differences
-        dt, dy, dx = tp - t0, yp - y0, xp - x0
+        dt, dy, dx = tps - t0, yps - y0, xps - x0
 
         # Interpolate along x axis
-        c00 = arr[t0, y0, x0] * (1 - dx) + arr[t0, y0, x1] * dx
-        c01 = arr[t0, y1, x0] * (1 - dx) + arr[t0, y1, x1] * dx
-        c10 = arr[t1, y0, x0] * (1 - dx) + arr[t1, y0, x1] * dx
-        c11 = arr[t1, y1, x0] * (1 - dx) + arr[t1, y1, x1] * dx
+        c00 = arr[..., t0, y0, x0] * (1 - dx) + arr[..., t0, y0, x1] * dx
+        c01 = arr[..., t0, y1, x0] * (1 - dx) + arr[..., t0, y1, x1] * dx
+        c10 = arr[..., t1, y0, x0] * (1 - dx) + arr[..., t1, y0, x1] * dx
+        c11 = arr[..., t1, y1, x0] * (1 - dx) + arr[..., t1, y1, x1] * dx
 
         # Interpolate along y axis
         c0 = c00 * (1 - dy) + c01 * dy
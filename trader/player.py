@@ -1,37 +1,98 @@
 """The player.
 
 """
+import math
+
+import numpy as np
+
 from typing import Any, Dict, List, Optional, Tuple
 
 from .farmer import Farmer
 from .good import Good
 from .location import Location
 from .noise_controller import NoiseController
+from .util import format_cents
+
+
+class PriceStats:
+    def __init__(self, n_goods: int):
+        """Running statistics of the prices seen for each Good, indexed by
+        `Good.idx` and updated with a vectorized Welford's online algorithm.
+
+        Args:
+            n_goods (int): Number of Goods to track prices for.
+
+        """
+        self.n = np.zeros(n_goods, dtype=np.int64)
+        self.mean = np.zeros(n_goods)
+        self.m2 = np.zeros(n_goods)
+        return
+
+    def std(self, idx: int) -> float:
+        """Population standard deviation of the prices seen so far for a Good.
+
+        Args:
+            idx (int): Index of the Good.
+
+        Returns:
+            std (float): Standard deviation of the Good's seen prices.
+
+        """
+        n = self.n[idx]
+        return math.sqrt(self.m2[idx] / n) if n > 0 else 0.
+
+    def update(self, good_ids: np.ndarray, prices: np.ndarray) -> None:
+        """Add a newly seen price for each of several Goods.
+
+        Args:
+            good_ids (np.ndarray): Unique indices of the Goods.
+            prices (np.ndarray): Newly seen prices, aligned with `good_ids`.
+
+        Returns: None
+
+        """
+        self.n[good_ids] += 1
+        delta = prices - self.mean[good_ids]
+        self.mean[good_ids] += delta / self.n[good_ids]
+        self.m2[good_ids] += delta * (prices - self.mean[good_ids])
+        return
 
 
 class Player:
+    __slots__ = (
+        'location', 'params', 'noise_controller', 'goods', 'trading_farmer',
+        'last_farmer', 'inventory', 'money_cents', 'seen_buy_prices',
+        'seen_sell_prices', 'travel_cost_cents')
+
     def __init__(
             self,
             location: Location,
             player_params: Dict[str, Any],
             noise_controller: NoiseController,
-            goods: List[Good]):
+            goods: List[Good],
+            travel_cost_cents: np.ndarray):
         self.location = None
         self.move_location(location, 0, False)
         self.params = player_params
+        # Cost of travelling between each pair of Locations in integer cents,
+        # indexed by `Location.idx`
+        self.travel_cost_cents = travel_cost_cents
         self.noise_controller = noise_controller
         self.goods = goods
 
         self.trading_farmer = None
         self.last_farmer = None
 
-        self.inventory = {good: 0 for good in self.goods}
-        self.money = 0
+        # Quantity of each Good held, indexed by `Good.idx`
+        self.inventory = np.zeros(len(self.goods), dtype=np.int64)
+        # Money is kept as exact integer cents, so that repeated trades never
+        # accumulate rounding error
+        self.money_cents = 0
 
         # Track buy and sell prices seen so far, to cue when there is a good
         # or bad deal in trade menus
-        self.seen_buy_prices = {good: [] for good in self.goods}
-        self.seen_sell_prices = {good: [] for good in self.goods}
+        self.seen_buy_prices = PriceStats(len(self.goods))
+        self.seen_sell_prices = PriceStats(len(self.goods))
 
         self.init()
         return
@@ -58,27 +119,28 @@ class Player:
         """
         if not isinstance(quantity, int) or quantity < 1:
             return False, f'Quantity ({quantity}) must be an integer greater than 0.'
-        if farmer.inventory[good] < quantity:
+        if farmer.inventory[good.idx] < quantity:
             return False, f'{farmer.name} does not have {quantity} of {good}.'
         if price is not None and price < 0:
             return False, f'Price ({price}) must be nonnegative.'
         elif price is None:
-            price = farmer.buy_price(good)
-        buy_price = round(price * quantity, 2)
-        if buy_price > self.money:
-            return False, f'You do not have enough money to buy {quantity} of {good} (${buy_price:.2f}).'
+            buy_cents = int(farmer.buy_price_cents[good.idx]) * quantity
+        else:
+            buy_cents = round(price * quantity * 100)
+        if buy_cents > self.money_cents:
+            return False, f'You do not have enough money to buy {quantity} of {good} ({format_cents(buy_cents)}).'
 
-        farmer.inventory[good] -= quantity
-        farmer.money += buy_price
-        self.inventory[good] += quantity
-        self.money -= buy_price
-        return True, f'Bought {quantity} of {good} from {farmer.name} for ${buy_price:.2f}.'
+        farmer.inventory[good.idx] -= quantity
+        farmer.money_cents += buy_cents
+        self.inventory[good.idx] += quantity
+        self.money_cents -= buy_cents
+        return True, f'Bought {quantity} of {good} from {farmer.name} for {format_cents(buy_cents)}.'
 
     def init(self) -> None:
         """Initialize the Player.
 
         """
-        self.money = self.init_money()
+        self.money_cents = round(self.init_money() * 100)
         return
 
     def init_money(self) -> float:
@@ -90,19 +152,25 @@ class Player:
         """
         return self.params['init_money']
 
-    def location_travel_cost(self, location: Location) -> float:
-        """Compute the cost of moving to `location`.
+    def location_travel_costs(self, locations: List[Location]) -> List[float]:
+        """Compute the costs of moving to each of several Locations.
 
         Args:
-            location (Location): Location to compute cost to.
+            locations (List[Location]): Locations to compute costs to.
 
         Returns:
-            cost (float): Cost of moving to `location`.
+            costs (List[float]): Cost of moving to each Location in
+                `locations`.
 
         """
-        cost = round(self.params['travel_cost_multiplier'] *
-            location.distance_to(self.location)**2, 2)
-        return cost
+        idx = [location.idx for location in locations]
+        costs = (self.travel_cost_cents[self.location.idx, idx] / 100).tolist()
+        return costs
+
+    @property
+    def money(self) -> float:
+        """The Player's current amount of money, in dollars."""
+        return self.money_cents / 100
 
     def move_farmer(self, farmer: Farmer, day_index: int) -> Tuple[bool, str]:
         """Within a Location, move to trade with a Farmer.
@@ -116,7 +184,7 @@ class Player:
             message (str): Message describing the move outcome.
 
         """
-        if farmer.location != self.location:
+        if farmer.location is not self.location:
             return False, f'Farmer {farmer.name} not present at {self.location}.'
         self.set_new_farmer(farmer)
         farmer.last_visit = day_index
@@ -137,22 +205,21 @@ class Player:
             message (str): Message describing the move outcome.
 
         """
-        if location == self.location:
+        if location is self.location:
             return False, f'Already at {location}.'
         if pay:
-            travel_cost = self.location_travel_cost(location)
-            if travel_cost > self.money:
-                return False, f'${travel_cost:.2f} required to travel to {location}.'
-            self.money -= travel_cost
+            travel_cents = int(self.travel_cost_cents[self.location.idx, location.idx])
+            if travel_cents > self.money_cents:
+                return False, f'{format_cents(travel_cents)} required to travel to {location}.'
+            self.money_cents -= travel_cents
         else:
-            travel_cost = 0
+            travel_cents = 0
         self.location = location
-        for farmer in self.location.farmers:
-            farmer.seen_goods = False
+        self.location.seen_goods.fill(False)
         self.trading_farmer = None
         self.last_farmer = None
         location.last_visit = day_index
-        return True, f'Traveled to {location} for ${travel_cost:.2f}.'
+        return True, f'Traveled to {location} for {format_cents(travel_cents)}.'
 
     def print_money(self) -> str:
         """Print the Player's current amount of money, properly formatted.
@@ -162,7 +229,7 @@ class Player:
                 money.
 
         """
-        return f'${self.money:.2f}'
+        return format_cents(self.money_cents)
 
     def sell(
             self,
@@ -186,20 +253,21 @@ class Player:
         """
         if not isinstance(quantity, int) or quantity < 1:
             return False, f'Quantity ({quantity}) must be an integer greater than 0.'
-        if self.inventory[good] < quantity:
+        if self.inventory[good.idx] < quantity:
             return False, f'You do not have {quantity} of {good}.'
         if price is not None and price < 0:
             return False, f'Price ({price}) must be nonnegative.'
         elif price is None:
-            price = farmer.sell_price(good)
-        sell_price = round(price * quantity, 2)
-        if sell_price > farmer.money:
-            return False, f'{farmer.name} does not have enough money to buy {quantity} of {good}. (${sell_price:.2f})'
-        self.inventory[good] -= quantity
-        self.money += sell_price
-        farmer.inventory[good] += quantity
-        farmer.money -= sell_price
-        return True, f'Sold {quantity} of {good} to {farmer.name} for ${sell_price:.2f}.'
+            sell_cents = int(farmer.sell_price_cents[good.idx]) * quantity
+        else:
+            sell_cents = round(price * quantity * 100)
+        if sell_cents > farmer.money_cents:
+            return False, f'{farmer.name} does not have enough money to buy {quantity} of {good}. ({format_cents(sell_cents)})'
+        self.inventory[good.idx] -= quantity
+        self.money_cents += sell_cents
+        farmer.inventory[good.idx] += quantity
+        farmer.money_cents -= sell_cents
+        return True, f'Sold {quantity} of {good} to {farmer.name} for {format_cents(sell_cents)}.'
 
     def set_new_farmer(self, farmer: Farmer) -> None:
         """Set a new current trading Farmer.
@@ -214,19 +282,22 @@ class Player:
         self.trading_farmer = farmer
         return
 
-    def update_price_tracking(self, farmer: Farmer, available_goods: List[Good]) -> None:
-        """Update price tracking info from the given Farmer and list of Goods.
+    def update_price_tracking(self, farmer: Farmer, good_ids: np.ndarray) -> None:
+        """Update price tracking info from the given Farmer and Goods.
 
         Args:
             farmer (Farmer): Farmer whose pricing info to add to tracking.
-            available_goods (List[Good]): Goods to update pricing info for.:
+            good_ids (np.ndarray): Indices of the Goods to update pricing info
+                for.
 
         Returns: None
 
         """
-        if not farmer.seen_goods:
-            for g in available_goods:
-                self.seen_buy_prices[g].append(farmer.buy_price(g))
-                self.seen_sell_prices[g].append(farmer.sell_price(g))
-            farmer.seen_goods = True
+        seen_goods = farmer.location.seen_goods
+        if not seen_goods[farmer.local_idx]:
+            self.seen_buy_prices.update(
+                good_ids, farmer.buy_price_cents[good_ids] / 100)
+            self.seen_sell_prices.update(
+                good_ids, farmer.sell_price_cents[good_ids] / 100)
+            seen_goods[farmer.local_idx] = True
         return
@@ -2,14 +2,16 @@ import re
 
 from typing import Optional, Tuple
 
-CLEAN_PATTERN = re.compile(r'[^a-zA-Z0-9]')
+# ASCII bytes removed by `clean_string`. Non-ASCII characters are dropped when
+# encoding
+CLEAN_DELETE_BYTES = bytes(
+    c for c in range(128) if not chr(c).isalnum())
 TRANSACTION_PATTERN = re.compile(
     r'^\s*(?:(.*?\D)\s+)?([-+]?\d*\.?\d+)(?:\s+(\D.*?))?\s*$')
-ALPHA_SPACE_PATTERN = re.compile(r'^[a-zA-Z\s]*$')
 
 
 def clean_string(string: str) -> str:
-    """Remove alphanumeric characters from a string and make all characters
+    """Remove non-alphanumeric characters from a string and make all characters
     lowercase.
 
     Args:
@@ -19,7 +21,23 @@ def clean_string(string: str) -> str:
         cleaned (str): A cleaned string.
 
     """
-    return CLEAN_PATTERN.sub('', string).lower()
+    cleaned = string.encode('ascii', 'ignore').translate(None, CLEAN_DELETE_BYTES)
+    return cleaned.decode('ascii').lower()
+
+
+def format_cents(cents: int) -> str:
+    """Format an amount of money in integer cents as dollars.
+
+    Args:
+        cents (int): Amount of money, in cents.
+
+    Returns:
+        formatted (str): Amount of money as a dollar string, e.g. `$1.05`.
+
+    """
+    sign = '-' if cents < 0 else ''
+    dollars, cents = divmod(abs(cents), 100)
+    return f'{sign}${dollars}.{cents:02d}'
 
 
 def parse_transaction(string: str) -> Tuple[Optional[int], Optional[str]]:
@@ -35,13 +53,14 @@ def parse_transaction(string: str) -> Tuple[Optional[int], Optional[str]]:
 
     """
     try:
-        match = re.match(TRANSACTION_PATTERN, string)
+        match = TRANSACTION_PATTERN.match(string)
 
         if match:
             before, quantity, after = match.groups()
 
-            # Convert the matched number
-            if '.' in quantity or '-' in quantity or 'e' in quantity.lower():
+            # Convert the matched number, which must be an unsigned or
+            # '+'-signed integer
+            if not quantity.lstrip('+').isdecimal():
                 return None, None
             quantity = int(quantity)
             if quantity < 1:
@@ -52,8 +71,9 @@ def parse_transaction(string: str) -> Tuple[Optional[int], Optional[str]]:
             if before and after:  # Text should not appear on both sides
                 return None, None
 
-            # Ensure the text contains only alphabetic characters and spaces
-            if good_name and not re.match(ALPHA_SPACE_PATTERN, good_name):
+            # Ensure the text contains only ASCII letters and whitespace
+            if good_name and not (
+                    good_name.isascii() and ''.join(good_name.split()).isalpha()):
                 return None, None
 
             return quantity, good_name.lower()
@@ -29,6 +29,9 @@ from .util import clean_string, parse_transaction, rgb_interpolate
 PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(PROJECT_DIR, 'data')
 LOCATIONS_FILE = os.path.join(DATA_DIR, 'locations.txt')
+CON_STORE_FILE = os.path.join(DATA_DIR, 'cons.json')
+# Number of days of production Farmers start out with
+N_INIT_INVENTORY_DAYS = 10
 
 
 class World:
@@ -79,6 +82,8 @@ class World:
     con_params = {
         'buy_threshold': 0.2,
         'sell_threshold': 2,
+        # Set to None to forget cons between games
+        'store_file': CON_STORE_FILE,
     }
 
     def __init__(self, seed: int, request_url: str, debug: bool = False):
@@ -99,19 +104,84 @@ class World:
         # Current day index (i.e. increases linearly, doesn't wrap for years)
         self.day_index = -1
 
+        # Per-Good state throughout the World is stored in arrays indexed by
+        # `Good.idx`
+        for i, good in enumerate(self.goods):
+            good.set_index(i)
+
         self.noise_controller = NoiseController(
             self.seed, self.goods, self.year_length, self.prod_params, self.location_params, self.farmer_params)
         self.rng = np.random.default_rng(self.seed * 2)
 
         self.locations = self.init_locations(LOCATIONS_FILE)
         self.farmers = self.init_farmers()
+
+        # All Farmer inventories live in a single (n_farmers, n_goods) matrix,
+        # with each Farmer's `inventory` a view of its row, so that daily
+        # production can be sampled for every Farmer and Good at once
+        self.inventory_matrix = np.stack([farmer.inventory for farmer in self.farmers])
+        for farmer, inventory in zip(self.farmers, self.inventory_matrix):
+            farmer.inventory = inventory
+        # Supply scores of every Location are a single (n_locations, n_farmers)
+        # by (n_farmers, n_goods) matrix product each day. Location supply
+        # scores and prices are views into rows of World matrices
+        for location in self.locations:
+            location.init_seen_goods()
+            location.init_supply_weights()
+        self.supply_weight_matrix = np.stack([
+            location.supply_weights for location in self.locations])
+        self.supply_score_matrix = np.stack([
+            location.supply_scores for location in self.locations])
+        self.location_price_matrix = np.stack([
+            location.prices for location in self.locations])
+        for location, supply_scores, prices in zip(
+                self.locations, self.supply_score_matrix, self.location_price_matrix):
+            location.supply_scores = supply_scores
+            location.prices = prices
+        # Farmer prices are likewise views into rows of a single matrix, so
+        # they can all be computed in one vectorized step each day
+        self.price_matrix = np.stack([farmer.prices for farmer in self.farmers])
+        for farmer, prices in zip(self.farmers, self.price_matrix):
+            farmer.prices = prices
+        # Farmers are created Location by Location, so each Location's Farmers
+        # are a contiguous block of rows
+        start = 0
+        for location in self.locations:
+            stop = start + len(location.farmers)
+            location.set_farmer_prices(self.price_matrix[start:stop])
+            start = stop
+        self.good_dist_matrix = np.stack([farmer.good_dist for farmer in self.farmers])
+        # Goods a Farmer does not produce take the Location price
+        self.not_produced_matrix = self.good_dist_matrix == 0
+        self.farmer_locations = np.array([
+            farmer.location.idx for farmer in self.farmers])
+        self.max_amounts = np.array([good.max_amount for good in self.goods])
+        # Production rates of every Location, with shape
+        # (year_length, n_locations, n_goods)
+        self.location_prod_rates = self.compute_location_prod_rates()
+
+        # Initialize Farmer inventories as an accumulation of the first days'
+        # worth of production
+        for day in range(N_INIT_INVENTORY_DAYS):
+            self.update_inventories(day)
         # Keep track of all buy and sell prices
 
         # Calculate base abundance (average amount of good per farmer)
+        base_abundances = self.calculate_base_abundances()
         for good in self.goods:
-            good.set_base_abundance(self.calculate_base_abundance(good, self.farmers))
+            good.set_base_abundance(base_abundances[good.idx])
+        base_prices = np.array([good.base_price for good in self.goods])
+        for location in self.locations:
+            location.set_good_baselines(base_prices, base_abundances)
 
-        self.player = Player(self.locations[0], self.player_params, self.noise_controller, self.goods)
+        # Travel costs between every pair of Locations, which are fixed after
+        # World construction
+        location_distance_matrix = np.stack([
+            location.location_distances for location in self.locations])
+        travel_cost_cents = np.rint(
+            self.player_params['travel_cost_multiplier'] * location_distance_matrix**2 * 100).astype(np.int64)
+        self.player = Player(
+            self.locations[0], self.player_params, self.noise_controller, self.goods, travel_cost_cents)
 
         self.state = WorldState.INIT
 
@@ -123,40 +193,57 @@ class World:
         # Initial debug information
         if self.debug:
             print(f'# Farmers: {len(self.farmers)}')
-            for good in self.goods:
-                invs = [
-                    [farmer.inventory[good]] for farmer in self.farmers]
-                for i in range(self.year_length):
-                    for j in range(len(self.farmers)):
-                        self.farmers[j].update_inventory(i)
-                        invs[j].append(self.farmers[j].inventory[good])
+            # Simulate a year of production for all Farmers at once, recording
+            # every day's inventories
+            invs = np.empty((self.year_length + 1,) + self.inventory_matrix.shape)
+            invs[0] = self.inventory_matrix
+            for i in range(self.year_length):
+                self.update_inventories(i)
+                invs[i + 1] = self.inventory_matrix
 
+            for good in self.goods:
                 f, ax = plt.subplots(1, 1)
                 f.set_size_inches(10, 10)
-                for inv in invs:
-                    ax.plot(inv)
+                ax.plot(invs[:, :, good.idx])
                 ax.set_title(good)
                 plt.show()
         return
 
-    @staticmethod
-    def calculate_base_abundance(good: Good, farmers: List[Farmer]) -> float:
-        """Calculate baseline abundance for a good.
+    def calculate_base_abundances(self) -> np.ndarray:
+        """Calculate baseline abundances of all Goods.
 
             Baseline abundance is average quantity of the good per farmer.
 
-            Args:
-                good (Good): Good to calculate baseline abundance for.
-                farmers (List[Farmer]): List of all Farmers.
-
             Returns:
-                baseline_abundance (float): Baseline abundance.
+                base_abundances (np.ndarray): Baseline abundance of each Good,
+                    indexed by `Good.idx`.
 
             """
-        n_farmers = len(farmers)
-        total_inventory = sum([f.inventory[good] for f in farmers])
-        baseline_abundance = total_inventory / n_farmers
-        return baseline_abundance
+        return self.inventory_matrix.sum(axis=0) / len(self.farmers)
+
+    def compute_location_prod_rates(self) -> np.ndarray:
+        """Compute the production rates of all Goods at all Locations on all
+        days of the year.
+
+        The production rate maps of all Goods are sampled for every day and
+        Location in a single batch.
+
+        Returns:
+            location_prod_rates (np.ndarray): Production rates with shape
+                (year_length, n_locations, n_goods), indexed by `Location.idx`
+                and `Good.idx`.
+
+        """
+        days = np.arange(self.year_length)
+        coords = np.array([location.location for location in self.locations])
+        base_prod_rates = np.array([good.base_prod_rate for good in self.goods])
+        prod_rate_multipliers = np.array([
+            good.prod_rate_multiplier for good in self.goods])
+        # (n_goods, year_length, n_locations) -> (year_length, n_locations, n_goods)
+        samples = np.moveaxis(
+            self.noise_controller.sample_goods_prod_batch(days, coords), 0, -1)
+        location_prod_rates = base_prod_rates + samples * prod_rate_multipliers
+        return np.ascontiguousarray(location_prod_rates)
 
     def get_buy_input(self) -> Tuple[Action, Optional[Good], Optional[int]]:
         """Parse a user input during a buy transaction.
@@ -294,15 +381,16 @@ class World:
             location_names = [n.strip() for n in location_names]
         n_locations = self.location_params['n_locations']
         location_names = list(self.rng.choice(location_names, size=n_locations))
+        location_xs, location_ys = self.noise_controller.sample_locations(n_locations)
         locations = [
-            Location(name, self.location_params['supply_sensitivity'], self.noise_controller, self.goods)
-            for name in location_names]
+            Location(name, (x, y), self.location_params['supply_sensitivity'], self.noise_controller, self.goods)
+            for name, x, y in zip(location_names, location_xs, location_ys)]
+        for i, location in enumerate(locations):
+            location.set_index(i)
         # Set inter-location distances
-        location_distance_matrix = np.zeros((n_locations, n_locations))
-        for i in range(n_locations - 1):
-            for j in range(i + 1, n_locations):
-                location_distance_matrix[i, j] = locations[i].distance_to(locations[j])
-                location_distance_matrix[j, i] = location_distance_matrix[i, j]
+        coords = np.array([location.location for location in locations])
+        offsets = coords[:, None, :] - coords[None, :, :]
+        location_distance_matrix = np.sqrt((offsets**2).sum(axis=-1))
         for i, location in enumerate(locations):
             location.set_locations_info(locations, location_distance_matrix[i])
 
@@ -653,7 +741,8 @@ class World:
         # Introduction from the farmer
         with Live(Spinner('simpleDots', text='[#cccccc]Thinking[/]'), refresh_per_second=3) as live:
             message = self.model.introduce(
-                current_farmer, WorldState.BUY_NEGOTIATION)
+                current_farmer, WorldState.BUY_NEGOTIATION,
+                on_output=lambda text: live.update(f'» {text}\n'))
             live.update(f'» {message}\n')
 
         while True:
@@ -662,7 +751,8 @@ class World:
                 raw_input = input(f'({self.player.print_money()}) > ')
             with Live(Spinner('simpleDots', text='[#cccccc]Thinking[/]'), refresh_per_second=3) as live:
                 action, purchase_info, message = self.model.negotiate_buy(
-                    current_farmer, raw_input)
+                    current_farmer, raw_input,
+                    on_output=lambda text: live.update(f'\n» {text}\n'))
                 if action == Action.BACK:
                     self.state = WorldState.AT_LOCATION
                     self.player.set_new_farmer(None)
@@ -733,7 +823,8 @@ class World:
         # Introduction from the farmer
         with Live(Spinner('simpleDots', text='[#cccccc]Thinking[/]'), refresh_per_second=3) as live:
             message = self.model.introduce(
-                current_farmer, WorldState.SELL_NEGOTIATION)
+                current_farmer, WorldState.SELL_NEGOTIATION,
+                on_output=lambda text: live.update(f'» {text}\n'))
             live.update(f'» {message}\n')
 
         while True:
@@ -741,7 +832,9 @@ class World:
             while raw_input == '':
                 raw_input = input(f'({self.player.print_money()}) > ')
             with Live(Spinner('simpleDots', text='[#cccccc]Thinking[/]'), refresh_per_second=3) as live:
-                action, sale_info, message = self.model.negotiate_sell(raw_input)
+                action, sale_info, message = self.model.negotiate_sell(
+                    current_farmer, raw_input,
+                    on_output=lambda text: live.update(f'\n» {text}\n'))
                 if action == Action.BACK:
                     self.state = WorldState.AT_LOCATION
                     self.player.set_new_farmer(None)
@@ -851,8 +944,50 @@ class World:
     def update(self):
         self.today = self.next_day()
         self.day_index += 1
+        self.update_inventories(self.today)
+        np.matmul(
+            self.supply_weight_matrix, self.inventory_matrix,
+            out=self.supply_score_matrix)
         for location in self.locations:
-            location.update(self.today)
+            location.update()
+        self.update_farmer_prices()
+        for location in self.locations:
+            location.update_farmers()
+        return
+
+    def update_farmer_prices(self) -> None:
+        """Update the prices of all Farmers at once, based on their inventories
+        and their Locations' supply scores and prices.
+
+        Returns: None
+
+        """
+        # Compute in place on a single buffer to avoid temporaries
+        factors = np.maximum(0.1, self.inventory_matrix)
+        np.divide(self.supply_score_matrix[self.farmer_locations], factors, out=factors)
+        np.power(factors, self.farmer_params['supply_sensitivity'], out=factors)
+        np.clip(factors, 0.5, 2, out=factors)
+        factors[self.not_produced_matrix] = 1
+        # Assign in place to keep the Farmers' price views valid
+        np.multiply(self.location_price_matrix[self.farmer_locations], factors, out=self.price_matrix)
+        return
+
+    def update_inventories(self, today: int) -> None:
+        """Update the inventories of all Farmers with a day's production.
+
+        Args:
+            today (int): Day of the year.
+
+        Returns: None
+
+        """
+        prod_rates = self.location_prod_rates[today, self.farmer_locations] * \
+            self.good_dist_matrix
+        deltas = self.noise_controller.sample_good_delta_batch(
+            prod_rates, self.inventory_matrix, self.max_amounts)
+        # Assign in place to keep the Farmers' inventory views valid
+        self.inventory_matrix[:] = np.clip(
+            (self.inventory_matrix + deltas).astype(np.int64), 0, self.max_amounts)
         return
 
     def view_inventory(self) -> None: